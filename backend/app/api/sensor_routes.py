@@ -1,140 +1,188 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, case, desc, func, or_, select
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
+import asyncio
+import csv
+import io
 import logging
+import os
 
-from ..database import get_db, SensorReading as DBSensorReading, FaultLog as DBFaultLog
+from ..database import (
+    get_db_read, get_db_write, ReadSessionLocal, SensorReading as DBSensorReading, FaultLog as DBFaultLog,
+    SensorStatsDaily as DBSensorStatsDaily
+)
+from ..cache import dashboard_cache, stats_cache, invalidate_cached_views, cache_generation, store_if_current
+from ..ingest import READING_COLUMNS, detected_fault_types, get_ingest_queue, store_readings
 from ..models import (
-    SensorDataInput, SensorReading, FaultLog, DashboardData, 
+    SensorDataInput, SensorDataBatch, SensorReading, FaultLog, DashboardData, 
     SensorStats, FaultResponse
 )
-from ..utils.sensor_parser import SensorDataParser
+from ..utils.sensor_parser import SENSOR_PACKET, process_sensor_batch, process_sensor_input, process_sensor_packet
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-@router.post("/sensor-data", response_model=dict)
+# Upper bound on packets accepted by a single /sensor-data/bulk request
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "500"))
+
+# Hot statements built once so SQLAlchemy's compiled cache is hit on every call
+LATEST_READING_STMT = select(DBSensorReading).order_by(desc(DBSensorReading.timestamp)).limit(1)
+RECENT_READINGS_STMT = select(DBSensorReading).order_by(desc(DBSensorReading.timestamp)).limit(20)
+RECENT_FAULTS_STMT = select(DBFaultLog).order_by(desc(DBFaultLog.timestamp)).limit(10)
+
+@router.post("/sensor-data", response_model=dict, status_code=202)
 async def receive_sensor_data(
     data: SensorDataInput,
-    db: Session = Depends(get_db)
+    request: Request,
+    queue: asyncio.Queue = Depends(get_ingest_queue)
 ):
     """
     Receive sensor data from NodeMCU
     Expected payload: {"sensorData": "IR:1,VIB_RAW:435,DIST_ADJ:18,ACC:123,456,789,FAULT:1", "timestamp": "2025-09-28T12:00:00"}
+    The reading is validated and queued; the ingest writer stores it with the next batch.
     """
+    # Process the sensor data
+    processed_data = process_sensor_input(
+        data.sensorData, 
+        data.timestamp
+    )
+    
+    if not processed_data:
+        raise HTTPException(status_code=400, detail="Invalid sensor data format")
+    
+    await queue.put(processed_data)
+    # Real traffic arrived: make the fallback generator re-check the latest reading time
+    request.app.state.last_reading_ts = None
+    
+    return {
+        "success": True,
+        "message": "Sensor data received and queued for storage",
+        "queued": True,
+        "faults_detected": detected_fault_types(processed_data),
+        "timestamp": processed_data.timestamp.isoformat()
+    }
+
+@router.post("/sensor-data-bin", response_model=dict, status_code=202)
+async def receive_sensor_data_bin(
+    request: Request,
+    queue: asyncio.Queue = Depends(get_ingest_queue)
+):
+    """
+    Receive one binary sensor packet (Content-Type: application/octet-stream)
+    Body is struct '<BHhhhhB': ir, vib_raw, dist_adj (tenths of a cm), acc_x, acc_y, acc_z, fault.
+    Skips text parsing entirely; the reading is timestamped on arrival and queued like /sensor-data.
+    """
+    processed_data = process_sensor_packet(await request.body(), datetime.utcnow())
+    
+    if not processed_data:
+        raise HTTPException(status_code=400, detail=f"Invalid sensor packet: expected {SENSOR_PACKET.size} bytes with IR and FAULT of 0 or 1")
+    
+    await queue.put(processed_data)
+    request.app.state.last_reading_ts = None
+    
+    return {
+        "success": True,
+        "message": "Sensor data received and queued for storage",
+        "queued": True,
+        "faults_detected": detected_fault_types(processed_data),
+        "timestamp": processed_data.timestamp.isoformat()
+    }
+
+@router.post("/sensor-data/bulk", response_model=dict)
+async def receive_sensor_data_bulk(
+    data: SensorDataBatch,
+    request: Request,
+    db: AsyncSession = Depends(get_db_write)
+):
+    """
+    Receive a batch of buffered sensor packets from NodeMCU
+    All readings and their fault logs are stored in a single transaction.
+    Packets that fail to parse are skipped and reported by index in "rejected".
+    """
+    if len(data.items) > BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: max {BATCH_SIZE} items")
+    
+    processed = process_sensor_batch((item.sensorData, item.timestamp) for item in data.items)
+    rejected = [i for i, p in enumerate(processed) if not p]
+    processed = [p for p in processed if p]
+    
+    if not processed:
+        raise HTTPException(status_code=400, detail="Invalid sensor data format")
+    
     try:
-        # Process the sensor data
-        processed_data = SensorDataParser.process_sensor_input(
-            data.sensorData, 
-            data.timestamp
-        )
-        
-        if not processed_data:
-            raise HTTPException(status_code=400, detail="Invalid sensor data format")
-        
-        # Create database record
-        db_reading = DBSensorReading(
-            timestamp=processed_data['timestamp'],
-            ir_detection=processed_data['ir_detection'],
-            vibration_raw=processed_data['vibration_raw'],
-            vibration_fault=processed_data['vibration_fault'],
-            distance_adjusted=processed_data['distance_adjusted'],
-            distance_fault=processed_data['distance_fault'],
-            acceleration_x=processed_data['acceleration_x'],
-            acceleration_y=processed_data['acceleration_y'],
-            acceleration_z=processed_data['acceleration_z'],
-            fault_detected=processed_data['fault_detected'],
-            raw_sensor_data=processed_data['raw_sensor_data']
-        )
-        
-        db.add(db_reading)
-        db.commit()
-        db.refresh(db_reading)
-        
-        # Create fault logs if any faults detected
-        fault_logs = []
-        if processed_data['vibration_fault']:
-            fault_log = DBFaultLog(
-                fault_type='vibration',
-                severity='major',
-                description=f'Vibration threshold exceeded: {processed_data["vibration_raw"]}',
-                sensor_reading_id=db_reading.id
-            )
-            db.add(fault_log)
-            fault_logs.append('vibration')
-        
-        if processed_data['distance_fault']:
-            fault_log = DBFaultLog(
-                fault_type='distance',
-                severity='minor',
-                description=f'Distance out of range: {processed_data["distance_adjusted"]}cm',
-                sensor_reading_id=db_reading.id
-            )
-            db.add(fault_log)
-            fault_logs.append('distance')
-        
-        if processed_data['ir_detection']:
-            fault_log = DBFaultLog(
-                fault_type='ir',
-                severity='critical',
-                description='Track obstruction detected',
-                sensor_reading_id=db_reading.id
-            )
-            db.add(fault_log)
-            fault_logs.append('ir')
-        
-        if processed_data.get('acceleration_fault'):
-            fault_log = DBFaultLog(
-                fault_type='acceleration',
-                severity='major',
-                description='Unusual acceleration detected',
-                sensor_reading_id=db_reading.id
-            )
-            db.add(fault_log)
-            fault_logs.append('acceleration')
-        
-        db.commit()
+        reading_ids, fault_count = await store_readings(db, processed)
+        await db.commit()
+        request.app.state.last_reading_ts = None
+        invalidate_cached_views()
         
-        logger.info(f"Stored sensor reading {db_reading.id} with faults: {fault_logs}")
+        logger.info(f"Stored {len(reading_ids)} sensor readings with {fault_count} faults")
         
         return {
             "success": True,
-            "message": "Sensor data received and stored",
-            "reading_id": db_reading.id,
-            "faults_detected": fault_logs,
-            "timestamp": processed_data['timestamp'].isoformat()
+            "message": "Sensor data batch received and stored",
+            "reading_ids": reading_ids,
+            "faults_detected": fault_count,
+            "rejected": rejected
         }
         
     except Exception as e:
-        logger.error(f"Error processing sensor data: {str(e)}")
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error processing sensor data: {str(e)}")
+        logger.error(f"Error processing sensor data batch: {str(e)}")
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error processing sensor data batch: {str(e)}")
 
 @router.get("/sensor-data/latest", response_model=Optional[SensorReading])
-async def get_latest_reading(db: Session = Depends(get_db)):
+async def get_latest_reading(db: AsyncSession = Depends(get_db_read)):
     """Get the most recent sensor reading"""
-    reading = db.query(DBSensorReading).order_by(desc(DBSensorReading.timestamp)).first()
-    return reading
+    result = await db.execute(LATEST_READING_STMT)
+    return result.scalars().first()
+
+def _parse_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Split an X-Next-Cursor value ("<timestamp>,<id>") into its keyset parts"""
+    try:
+        timestamp, reading_id = cursor.rsplit(',', 1)
+        return datetime.fromisoformat(timestamp), int(reading_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/sensor-data", response_model=List[SensorReading])
 async def get_sensor_data(
+    response: Response,
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db_read)
 ):
-    """Get historical sensor data with pagination and filtering"""
-    query = db.query(DBSensorReading).order_by(desc(DBSensorReading.timestamp))
+    """
+    Get historical sensor data with pagination and filtering
+    Prefer keyset pagination: pass the X-Next-Cursor header of the previous page as cursor.
+    The cursor is (timestamp, id), so readings sharing a timestamp are never skipped between pages.
+    offset is kept for older clients but has to scan and discard the skipped rows.
+    """
+    query = select(DBSensorReading).order_by(desc(DBSensorReading.timestamp), desc(DBSensorReading.id))
     
+    if cursor:
+        before_timestamp, before_id = _parse_cursor(cursor)
+        query = query.where(or_(
+            DBSensorReading.timestamp < before_timestamp,
+            and_(DBSensorReading.timestamp == before_timestamp, DBSensorReading.id < before_id)
+        ))
     if start_date:
-        query = query.filter(DBSensorReading.timestamp >= start_date)
+        query = query.where(DBSensorReading.timestamp >= start_date)
     if end_date:
-        query = query.filter(DBSensorReading.timestamp <= end_date)
+        query = query.where(DBSensorReading.timestamp <= end_date)
+    if offset:
+        query = query.offset(offset)
     
-    readings = query.offset(offset).limit(limit).all()
+    result = await db.execute(query.limit(limit))
+    readings = result.scalars().all()
+    if len(readings) == limit and readings[-1].timestamp:
+        last = readings[-1]
+        response.headers["X-Next-Cursor"] = f"{last.timestamp.isoformat()},{last.id}"
     return readings
 
 @router.get("/faults", response_model=List[FaultLog])
@@ -142,29 +190,31 @@ async def get_faults(
     limit: int = Query(50, ge=1, le=500),
     resolved: Optional[bool] = None,
     severity: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db_read)
 ):
     """Get fault logs with filtering options"""
-    query = db.query(DBFaultLog).order_by(desc(DBFaultLog.timestamp))
+    query = select(DBFaultLog).order_by(desc(DBFaultLog.timestamp))
     
     if resolved is not None:
-        query = query.filter(DBFaultLog.resolved == resolved)
+        query = query.where(DBFaultLog.resolved == resolved)
     if severity:
-        query = query.filter(DBFaultLog.severity == severity)
+        query = query.where(DBFaultLog.severity == severity)
     
-    faults = query.limit(limit).all()
-    return faults
+    result = await db.execute(query.limit(limit))
+    return result.scalars().all()
 
 @router.put("/faults/{fault_id}/resolve", response_model=FaultResponse)
-async def resolve_fault(fault_id: int, db: Session = Depends(get_db)):
+async def resolve_fault(fault_id: int, db: AsyncSession = Depends(get_db_write)):
     """Mark a fault as resolved"""
-    fault = db.query(DBFaultLog).filter(DBFaultLog.id == fault_id).first()
+    result = await db.execute(select(DBFaultLog).where(DBFaultLog.id == fault_id))
+    fault = result.scalar_one_or_none()
     if not fault:
         raise HTTPException(status_code=404, detail="Fault not found")
     
     fault.resolved = True
     fault.resolved_at = datetime.utcnow()
-    db.commit()
+    await db.commit()
+    invalidate_cached_views()
     
     return FaultResponse(
         success=True,
@@ -172,40 +222,39 @@ async def resolve_fault(fault_id: int, db: Session = Depends(get_db)):
         fault_id=fault_id
     )
 
-@router.get("/stats", response_model=SensorStats)
-async def get_sensor_stats(db: Session = Depends(get_db)):
-    """Get sensor statistics for dashboard"""
-    # Total readings
-    total_readings = db.query(DBSensorReading).count()
-    
-    # Total faults
-    total_faults = db.query(DBFaultLog).count()
+async def _compute_stats(db: AsyncSession) -> SensorStats:
+    """Aggregate sensor statistics (uncached); shared by /stats and /dashboard"""
+    today = datetime.utcnow().date()
     
-    # Fault rate
-    fault_rate = (total_faults / total_readings * 100) if total_readings > 0 else 0
+    # Totals and averages come from the daily rollup: O(days) instead of O(readings)
+    rollup = (await db.execute(select(
+        func.coalesce(func.sum(DBSensorStatsDaily.readings), 0).label('total_readings'),
+        func.coalesce(func.sum(DBSensorStatsDaily.faults), 0).label('total_faults'),
+        func.sum(DBSensorStatsDaily.sum_vib).label('sum_vib'),
+        func.sum(DBSensorStatsDaily.sum_dist).label('sum_dist'),
+        func.coalesce(func.sum(case(
+            (DBSensorStatsDaily.date == today, DBSensorStatsDaily.ir_detections), else_=0
+        )), 0).label('ir_detections_today')
+    ))).one()
     
-    # Average vibration and distance
-    avg_stats = db.query(
-        func.avg(DBSensorReading.vibration_raw).label('avg_vibration'),
-        func.avg(DBSensorReading.distance_adjusted).label('avg_distance')
-    ).first()
+    # Last reading time (index lookup on timestamp)
+    last_reading_time = await db.scalar(select(func.max(DBSensorReading.timestamp)))
     
-    avg_vibration = float(avg_stats.avg_vibration) if avg_stats.avg_vibration else 0
-    avg_distance = float(avg_stats.avg_distance) if avg_stats.avg_distance else 0
+    # Active (unresolved) faults; resolution changes outside ingest so this is not rolled up
+    active_faults = await db.scalar(
+        select(func.count()).select_from(DBFaultLog).where(DBFaultLog.resolved == False)
+    )
     
-    # Last reading time
-    last_reading = db.query(DBSensorReading).order_by(desc(DBSensorReading.timestamp)).first()
-    last_reading_time = last_reading.timestamp if last_reading else None
+    total_readings = rollup.total_readings
+    total_faults = rollup.total_faults
     
-    # IR detections today
-    today = datetime.utcnow().date()
-    ir_detections_today = db.query(DBSensorReading).filter(
-        func.date(DBSensorReading.timestamp) == today,
-        DBSensorReading.ir_detection == 1
-    ).count()
+    # Fault rate
+    fault_rate = (total_faults / total_readings * 100) if total_readings > 0 else 0
     
-    # Active (unresolved) faults
-    active_faults = db.query(DBFaultLog).filter(DBFaultLog.resolved == False).count()
+    # Average vibration and distance
+    avg_vibration = float(rollup.sum_vib) / total_readings if total_readings and rollup.sum_vib else 0
+    avg_distance = float(rollup.sum_dist) / total_readings if total_readings and rollup.sum_dist else 0
+    ir_detections_today = rollup.ir_detections_today
     
     return SensorStats(
         total_readings=total_readings,
@@ -218,20 +267,45 @@ async def get_sensor_stats(db: Session = Depends(get_db)):
         active_faults=active_faults
     )
 
+@router.get("/stats", response_model=SensorStats)
+async def get_sensor_stats(db: AsyncSession = Depends(get_db_read)):
+    """Get sensor statistics for dashboard"""
+    stats = stats_cache.get("stats")
+    if stats is None:
+        generation = cache_generation()
+        stats = store_if_current(stats_cache, "stats", await _compute_stats(db), generation)
+    return stats
+
+async def _fetch_all(stmt):
+    async with ReadSessionLocal() as db:
+        result = await db.execute(stmt)
+        return result.scalars().all()
+
+async def _fetch_stats():
+    # Back-to-back /dashboard and /stats polls share one cached snapshot
+    stats = stats_cache.get("stats")
+    if stats is None:
+        generation = cache_generation()
+        async with ReadSessionLocal() as db:
+            stats = store_if_current(stats_cache, "stats", await _compute_stats(db), generation)
+    return stats
+
 @router.get("/dashboard", response_model=DashboardData)
-async def get_dashboard_data(db: Session = Depends(get_db)):
+async def get_dashboard_data():
     """Get complete dashboard data in one request"""
-    # Latest reading
-    latest_reading = db.query(DBSensorReading).order_by(desc(DBSensorReading.timestamp)).first()
+    cached = dashboard_cache.get("dashboard")
+    if cached is not None:
+        return cached
+    generation = cache_generation()
     
-    # Recent readings (last 20)
-    recent_readings = db.query(DBSensorReading).order_by(desc(DBSensorReading.timestamp)).limit(20).all()
-    
-    # Recent faults (last 10)
-    recent_faults = db.query(DBFaultLog).order_by(desc(DBFaultLog.timestamp)).limit(10).all()
-    
-    # Stats
-    stats_data = await get_sensor_stats(db)
+    # The queries are independent, so run them concurrently, each on its own session.
+    # Recent readings (last 20; the first one is the latest reading), recent faults (last 10) and stats
+    recent_readings, recent_faults, stats_data = await asyncio.gather(
+        _fetch_all(RECENT_READINGS_STMT),
+        _fetch_all(RECENT_FAULTS_STMT),
+        _fetch_stats()
+    )
+    latest_reading = recent_readings[0] if recent_readings else None
     
     # Connection status with tighter thresholds
     connection_status = "connected"
@@ -244,36 +318,49 @@ async def get_dashboard_data(db: Session = Depends(get_db)):
     else:
         connection_status = "no_data"
     
-    return DashboardData(
+    dashboard = DashboardData(
         latest_reading=latest_reading,
         recent_readings=recent_readings,
         recent_faults=recent_faults,
         stats=stats_data,
         connection_status=connection_status
     )
+    return store_if_current(dashboard_cache, "dashboard", dashboard, generation)
+
+EXPORT_COLUMNS = ('id',) + READING_COLUMNS
+EXPORT_CHUNK_ROWS = 500
 
-@router.get("/export", response_model=dict)
-async def export_csv(db: Session = Depends(get_db)):
-    """Export last 6 hours of readings as CSV string (inline)."""
-    import csv
-    import io
+@router.get("/export")
+async def export_csv():
+    """Stream the last 6 hours of readings as a CSV download."""
     cutoff = datetime.utcnow() - timedelta(hours=6)
-    readings = (
-        db.query(DBSensorReading)
-        .filter(DBSensorReading.timestamp >= cutoff)
+    query = (
+        select(*(getattr(DBSensorReading, col) for col in EXPORT_COLUMNS))
+        .where(DBSensorReading.timestamp >= cutoff)
         .order_by(desc(DBSensorReading.timestamp))
-        .all()
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    
+    async def generate_csv():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(EXPORT_COLUMNS)
+        # The session lives inside the generator so it stays open for the whole response
+        async with ReadSessionLocal() as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                writer.writerows(
+                    (r[0], r[1].isoformat() if r[1] else '', *r[2:])
+                    for r in rows
+                )
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        if output.tell():
+            yield output.getvalue()
+    
+    return StreamingResponse(
+        generate_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="itms_export.csv"'}
     )
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        'id','timestamp','ir_detection','vibration_raw','vibration_fault','distance_adjusted','distance_fault',
-        'acceleration_x','acceleration_y','acceleration_z','fault_detected','raw_sensor_data'
-    ])
-    for r in readings:
-        writer.writerow([
-            r.id, r.timestamp.isoformat() if r.timestamp else '', r.ir_detection, r.vibration_raw, r.vibration_fault,
-            r.distance_adjusted, r.distance_fault, r.acceleration_x, r.acceleration_y, r.acceleration_z,
-            r.fault_detected, r.raw_sensor_data
-        ])
-    return {"filename": "itms_export.csv", "csv": output.getvalue()}
\ No newline at end of file
@@ -0,0 +1,29 @@
+from cachetools import TTLCache
+
+# Per-process response caches for the polled dashboard endpoints.
+# With several workers each keeps its own copy; swap for a shared cache (e.g. Redis) if that matters.
+DASHBOARD_TTL = 1.0
+STATS_TTL = 5.0  # totals move slowly
+
+dashboard_cache = TTLCache(maxsize=1, ttl=DASHBOARD_TTL)
+stats_cache = TTLCache(maxsize=1, ttl=STATS_TTL)
+
+# Bumped on every invalidation so a computation that started before it can tell its result is stale
+_generation = 0
+
+def cache_generation():
+    """Current invalidation generation; read it before computing a value to cache"""
+    return _generation
+
+def store_if_current(cache, key, value, generation):
+    """Cache value only if no invalidation happened since generation was read"""
+    if generation == _generation:
+        cache[key] = value
+    return value
+
+def invalidate_cached_views():
+    """Drop cached dashboard/stats responses after data changes"""
+    global _generation
+    _generation += 1
+    dashboard_cache.clear()
+    stats_cache.clear()
@@ -1,27 +1,103 @@
-from sqlalchemy import create_engine, Column, Integer, Float, String, DateTime, Boolean
+from sqlalchemy import event, case, func, select, Column, Index, Integer, Float, String, Date, DateTime, Boolean
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable
 import os
 
 # Database configuration
-def _resolve_database_url() -> str:
-    env_url = os.getenv("DATABASE_URL")
-    if not env_url or env_url.strip() == "":
-        return "sqlite:///./itms_data.db"
-    # Railway often provides postgres URLs that start with postgres://; SQLAlchemy prefers postgresql+psycopg2://
+def _normalize_database_url(env_url: str) -> str:
+    # Railway often provides postgres URLs that start with postgres://; the async engine needs postgresql+asyncpg://
     if env_url.startswith("postgres://"):
-        env_url = env_url.replace("postgres://", "postgresql+psycopg2://", 1)
+        env_url = env_url.replace("postgres://", "postgresql+asyncpg://", 1)
     elif env_url.startswith("postgresql://"):
-        env_url = env_url.replace("postgresql://", "postgresql+psycopg2://", 1)
+        env_url = env_url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    elif env_url.startswith("sqlite://"):
+        env_url = env_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
     return env_url
 
+def _resolve_database_url() -> str:
+    env_url = os.getenv("DATABASE_URL")
+    if not env_url or env_url.strip() == "":
+        return "sqlite+aiosqlite:///./itms_data.db"
+    return _normalize_database_url(env_url)
+
 DATABASE_URL = _resolve_database_url()
 
-# SQLite needs special thread option; others don't
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _resolve_read_url() -> str:
+    replica_url = os.getenv("DATABASE_READ_URL")
+    if replica_url and replica_url.strip():
+        return _normalize_database_url(replica_url)
+    url = make_url(DATABASE_URL)
+    if not url.drivername.startswith("sqlite") or url.database in (None, "", ":memory:"):
+        return DATABASE_URL
+    # Open the same SQLite file read-only so dashboard queries can never take the write lock
+    return url.set(database=f"file:{url.database}", query={"mode": "ro", "uri": "true"}).render_as_string(hide_password=False)
+
+DATABASE_READ_URL = _resolve_read_url()
+
+# SQLite needs special thread option and a longer busy timeout; others don't
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+connect_args = {"check_same_thread": False, "timeout": 30} if IS_SQLITE else {}
+
+# Server databases (Postgres via asyncpg) get sized pools. Ingest and dashboard reads use separate
+# engines so a slow /dashboard or /export query cannot starve writes of connections.
+def _pool_options(pool_size: str) -> dict:
+    if IS_SQLITE:
+        return {}
+    return {
+        "pool_size": int(pool_size),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_pre_ping": True,
+    }
+
+write_engine = create_async_engine(
+    DATABASE_URL,
+    connect_args=connect_args,
+    **_pool_options(os.getenv("DB_WRITE_POOL_SIZE", "4")),
+    **({} if IS_SQLITE else {"isolation_level": "READ COMMITTED"})
+)
+if IS_SQLITE and DATABASE_READ_URL == DATABASE_URL:
+    # In-memory SQLite is private to its connection, so reads must share the write engine
+    read_engine = write_engine
+else:
+    read_engine = create_async_engine(
+        DATABASE_READ_URL,
+        connect_args=connect_args,
+        **_pool_options(os.getenv("DB_READ_POOL_SIZE", "16"))
+    )
+
+# WAL lets dashboard reads proceed while ingest writes; NORMAL sync is safe under WAL.
+# journal_mode is persisted in the database file, so it is only set from the write engine.
+SQLITE_WRITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+)
+SQLITE_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+def _set_sqlite_pragmas(pragmas):
+    def listener(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+    return listener
+
+if IS_SQLITE:
+    event.listen(write_engine.sync_engine, "connect", _set_sqlite_pragmas(SQLITE_WRITE_PRAGMAS + SQLITE_PRAGMAS))
+    if read_engine is not write_engine:
+        event.listen(read_engine.sync_engine, "connect", _set_sqlite_pragmas(SQLITE_PRAGMAS))
+
+SessionLocal = async_sessionmaker(write_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+ReadSessionLocal = async_sessionmaker(read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -67,14 +143,137 @@ class FaultLog(Base):
     resolved = Column(Boolean, default=False)
     resolved_at = Column(DateTime, nullable=True)
 
-def create_tables():
+class SensorStatsDaily(Base):
+    """Per-day rollup of sensor counters, maintained incrementally on ingest"""
+    __tablename__ = "sensor_stats_daily"
+    
+    date = Column(Date, primary_key=True)
+    readings = Column(Integer, default=0, nullable=False)
+    faults = Column(Integer, default=0, nullable=False)  # fault_logs rows created for the day's readings
+    sum_vib = Column(Float, default=0.0, nullable=False)
+    sum_dist = Column(Float, default=0.0, nullable=False)
+    ir_detections = Column(Integer, default=0, nullable=False)
+
+DAILY_STATS_COUNTERS = ("readings", "faults", "sum_vib", "sum_dist", "ir_detections")
+
+# Composite indexes for the hot filter + ORDER BY timestamp predicates
+Index("ix_sr_ir_ts", SensorReading.ir_detection, SensorReading.timestamp)
+Index("ix_sr_fault_ts", SensorReading.fault_detected, SensorReading.timestamp)
+Index("ix_fl_resolved_ts", FaultLog.resolved, FaultLog.timestamp)
+Index("ix_fl_severity_ts", FaultLog.severity, FaultLog.timestamp)
+
+def _daily_stats_insert():
+    """Dialect-specific INSERT into sensor_stats_daily, which supports the conflict clauses"""
+    dialect = write_engine.dialect.name
+    return (mysql_insert if dialect == "mysql" else pg_insert if dialect == "postgresql" else sqlite_insert)(SensorStatsDaily)
+
+def _daily_stats_upsert():
+    """INSERT ... ON CONFLICT statement that adds to an existing day's counters"""
+    stmt = _daily_stats_insert()
+    if write_engine.dialect.name == "mysql":
+        return stmt.on_duplicate_key_update({
+            name: getattr(SensorStatsDaily, name) + stmt.inserted[name] for name in DAILY_STATS_COUNTERS
+        })
+    return stmt.on_conflict_do_update(
+        index_elements=[SensorStatsDaily.date],
+        set_={name: getattr(SensorStatsDaily, name) + stmt.excluded[name] for name in DAILY_STATS_COUNTERS}
+    )
+
+def _rollup_day(timestamp: Any, rolled_up_at: datetime) -> date:
+    """
+    UTC day a reading is counted under in sensor_stats_daily
+    Stored timestamps are naive UTC; aware values are converted. A reading without a timestamp
+    counts toward the day it is rolled up, in live ingest and in the backfill alike.
+    """
+    if timestamp is None:
+        return rolled_up_at.date()
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date()
+
+async def record_daily_stats(db: AsyncSession, readings: Iterable[Dict[str, Any]], fault_counts: Iterable[int]):
+    """
+    Fold newly stored readings into the sensor_stats_daily rollup
+    fault_counts gives the number of fault_logs rows created for each reading.
+    Runs in the caller's transaction; one row per distinct day is upserted.
+    """
+    now = datetime.utcnow()
+    days: Dict[Any, Dict[str, Any]] = {}
+    for reading, fault_count in zip(readings, fault_counts):
+        day = _rollup_day(reading.get('timestamp'), now)
+        row = days.get(day)
+        if row is None:
+            row = days[day] = {"date": day, "readings": 0, "faults": 0, "sum_vib": 0.0, "sum_dist": 0.0, "ir_detections": 0}
+        row["readings"] += 1
+        row["faults"] += fault_count
+        row["sum_vib"] += reading['vibration_raw'] or 0
+        row["sum_dist"] += reading['distance_adjusted'] or 0
+        row["ir_detections"] += 1 if reading['ir_detection'] == 1 else 0
+    if days:
+        await db.execute(_daily_stats_upsert(), list(days.values()))
+
+def _backfill_daily_stats(conn):
+    """
+    Populate sensor_stats_daily from existing readings the first time it is created
+    Every worker runs this at startup, so days another worker already backfilled are skipped, not re-inserted.
+    """
+    if conn.scalar(select(func.count()).select_from(SensorStatsDaily)):
+        return
+    fault_counts = (
+        select(FaultLog.sensor_reading_id, func.count().label("n"))
+        .group_by(FaultLog.sensor_reading_id)
+        .subquery()
+    )
+    # The column holds naive UTC, so its date is already the UTC day; NULLs go to today as in record_daily_stats
+    day = func.date(func.coalesce(SensorReading.timestamp, datetime.utcnow()))
+    rows = (
+        select(
+            day,
+            func.count(),
+            func.coalesce(func.sum(fault_counts.c.n), 0),
+            func.coalesce(func.sum(SensorReading.vibration_raw), 0),
+            func.coalesce(func.sum(SensorReading.distance_adjusted), 0),
+            func.sum(case((SensorReading.ir_detection == 1, 1), else_=0)),
+        )
+        .outerjoin(fault_counts, fault_counts.c.sensor_reading_id == SensorReading.id)
+        .group_by(day)
+    )
+    stmt = _daily_stats_insert().from_select(["date", *DAILY_STATS_COUNTERS], rows)
+    if write_engine.dialect.name == "mysql":
+        stmt = stmt.prefix_with("IGNORE")
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=[SensorStatsDaily.date])
+    conn.execute(stmt)
+
+def _create_schema(conn):
+    Base.metadata.create_all(conn)
+    # create_all skips indexes of tables that already exist, so add any new ones explicitly
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+    _backfill_daily_stats(conn)
+
+async def create_tables():
     """Create database tables"""
-    Base.metadata.create_all(bind=engine)
+    async with write_engine.begin() as conn:
+        await conn.run_sync(_create_schema)
+
+async def analyze_tables():
+    """Refresh SQLite planner statistics so the composite indexes get picked"""
+    async with write_engine.begin() as conn:
+        await conn.exec_driver_sql("ANALYZE")
+
+async def optimize_tables():
+    """Let SQLite re-analyze tables whose statistics have drifted"""
+    async with write_engine.begin() as conn:
+        await conn.exec_driver_sql("PRAGMA optimize")
+
+async def get_db_write():
+    """Get database session for ingest and other writes"""
+    async with SessionLocal() as db:
+        yield db
 
-def get_db():
-    """Get database session"""
-    db = SessionLocal()
-    try:
+async def get_db_read():
+    """Get database session for read-only queries"""
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
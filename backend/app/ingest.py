@@ -0,0 +1,169 @@
+"""
+Sensor reading persistence and the buffered ingest writer
+/sensor-data enqueues parsed packets; drain_loop writes them in batches with one commit per batch.
+"""
+from fastapi import Request
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+
+from .cache import invalidate_cached_views
+from .database import SessionLocal, record_daily_stats, write_engine, SensorReading as DBSensorReading, FaultLog as DBFaultLog
+from .utils.sensor_parser import SensorRow
+
+logger = logging.getLogger(__name__)
+
+# Queue capacity; producers wait (backpressure) once it is full
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+# A batch is written once it holds this many readings...
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+# ...or this many seconds after its first reading arrived
+INGEST_FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.1"))
+# Wait before retrying a batch that failed to store
+INGEST_RETRY_DELAY = float(os.getenv("INGEST_RETRY_DELAY", "0.5"))
+
+READING_COLUMNS = (
+    'timestamp', 'ir_detection', 'vibration_raw', 'vibration_fault', 'distance_adjusted',
+    'distance_fault', 'acceleration_x', 'acceleration_y', 'acceleration_z', 'fault_detected',
+    'raw_sensor_data'
+)
+
+def detected_fault_types(row: SensorRow) -> List[str]:
+    """Names of the faults a processed reading will be logged with"""
+    return [fault['fault_type'] for fault in build_fault_rows(row, None)]
+
+def build_fault_rows(row: SensorRow, reading_id: Optional[int]) -> List[Dict[str, Any]]:
+    """Build fault_logs rows for a processed reading; reading_id is None before it is stored"""
+    rows = []
+    if row.vibration_fault:
+        rows.append({
+            'fault_type': 'vibration',
+            'severity': 'major',
+            'description': f'Vibration threshold exceeded: {row.vibration_raw}',
+            'sensor_reading_id': reading_id
+        })
+    if row.distance_fault:
+        rows.append({
+            'fault_type': 'distance',
+            'severity': 'minor',
+            'description': f'Distance out of range: {row.distance_adjusted}cm',
+            'sensor_reading_id': reading_id
+        })
+    if row.ir_detection:
+        rows.append({
+            'fault_type': 'ir',
+            'severity': 'critical',
+            'description': 'Track obstruction detected',
+            'sensor_reading_id': reading_id
+        })
+    if row.acceleration_fault:
+        rows.append({
+            'fault_type': 'acceleration',
+            'severity': 'major',
+            'description': 'Unusual acceleration detected',
+            'sensor_reading_id': reading_id
+        })
+    return rows
+
+async def store_readings(db: AsyncSession, processed: List[SensorRow]) -> Tuple[List[int], int]:
+    """
+    Insert processed readings, their fault logs and the daily rollup update
+    Uses one multi-row INSERT per table; the caller commits.
+    Returns the new reading ids (in input order) and the number of fault logs written.
+    """
+    readings = [row.as_record() for row in processed]
+    if write_engine.dialect.name == "sqlite":
+        # Ordered RETURNING is row-at-a-time on SQLite. Rowids are assigned in VALUES order under the
+        # write lock, so a batched unordered RETURNING sorted ascending gives the same ids.
+        result = await db.execute(insert(DBSensorReading).returning(DBSensorReading.id), readings)
+        reading_ids = sorted(result.scalars().all())
+    else:
+        result = await db.execute(
+            insert(DBSensorReading).returning(DBSensorReading.id, sort_by_parameter_order=True),
+            readings
+        )
+        reading_ids = result.scalars().all()
+
+    fault_rows = [build_fault_rows(row, reading_id) for reading_id, row in zip(reading_ids, processed)]
+    faults = [fault for rows in fault_rows for fault in rows]
+    if faults:
+        await db.execute(insert(DBFaultLog), faults)
+
+    await record_daily_stats(db, readings, [len(rows) for rows in fault_rows])
+    return reading_ids, len(faults)
+
+async def _next_batch(queue: asyncio.Queue) -> List[SensorRow]:
+    """Wait for one reading, then collect more until the batch is full or the flush interval passes"""
+    batch = [await queue.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + INGEST_FLUSH_INTERVAL
+    while len(batch) < INGEST_FLUSH_ROWS:
+        if not queue.empty():
+            batch.append(queue.get_nowait())
+            continue
+        timeout = deadline - loop.time()
+        if timeout <= 0:
+            break
+        try:
+            batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+        except asyncio.TimeoutError:
+            break
+    return batch
+
+async def _store_batch(batch: List[SensorRow]) -> Tuple[int, int]:
+    """Store a batch in its own transaction; returns (readings stored, fault logs written)"""
+    async with SessionLocal() as db:
+        try:
+            reading_ids, fault_count = await store_readings(db, batch)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+    return len(reading_ids), fault_count
+
+async def _store_with_retry(batch: List[SensorRow]) -> Tuple[int, int]:
+    """
+    Store a queued batch without losing readings to one bad row or a transient error
+    The batch is retried once after INGEST_RETRY_DELAY; if that fails too, rows are stored one
+    at a time so only the rows that fail on their own are dropped.
+    """
+    try:
+        return await _store_batch(batch)
+    except Exception:
+        logger.exception(f"Failed to store {len(batch)} queued sensor readings, retrying")
+    await asyncio.sleep(INGEST_RETRY_DELAY)
+    try:
+        return await _store_batch(batch)
+    except Exception:
+        logger.exception(f"Retry failed, storing {len(batch)} queued sensor readings one at a time")
+
+    stored = fault_count = 0
+    for row in batch:
+        try:
+            row_stored, row_faults = await _store_batch([row])
+        except Exception:
+            logger.exception(f"Dropping queued sensor reading from {row.timestamp}: {row.raw_sensor_data}")
+            continue
+        stored += row_stored
+        fault_count += row_faults
+    return stored, fault_count
+
+async def drain_loop(queue: asyncio.Queue):
+    """Background consumer writing queued readings in batches"""
+    while True:
+        batch = await _next_batch(queue)
+        try:
+            stored, fault_count = await _store_with_retry(batch)
+            if stored:
+                invalidate_cached_views()
+            logger.info(f"Stored {stored} queued sensor readings with {fault_count} faults")
+        finally:
+            for _ in batch:
+                queue.task_done()
+
+def get_ingest_queue(request: Request) -> asyncio.Queue:
+    """Get the application's ingest queue"""
+    return request.app.state.ingest_queue
@@ -1,11 +1,16 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import logging
 import os
-from .database import create_tables
+from .cache import invalidate_cached_views
+from .database import IS_SQLITE, analyze_tables, create_tables, optimize_tables
+from .ingest import INGEST_QUEUE_SIZE, drain_loop
 from .api import sensor_routes
-from .database import SessionLocal, SensorReading as DBSensorReading
+from .database import SessionLocal, ReadSessionLocal, record_daily_stats, SensorReading as DBSensorReading
+from sqlalchemy import func, select
 from datetime import datetime, timedelta
 import random
 
@@ -13,19 +18,123 @@ import random
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# SQLite planner maintenance: PRAGMA optimize this often (seconds)
+SQLITE_OPTIMIZE_INTERVAL = 3600
+
+async def sqlite_optimize_loop():
+    """Background task keeping SQLite statistics current as sensor_readings grows"""
+    while True:
+        await asyncio.sleep(SQLITE_OPTIMIZE_INTERVAL)
+        try:
+            await optimize_tables()
+        except Exception:  # noqa: BLE001
+            logger.exception("PRAGMA optimize failed")
+
+# Fallback generator re-reads the latest reading time at least every N ticks (2 s each)
+FALLBACK_RECHECK_TICKS = 10
+
+async def fallback_generator_loop(app: FastAPI):
+    """Background task inserting fallback readings to keep the UI live when no device is sending"""
+    ticks_since_check = 0
+    while True:
+        try:
+            await asyncio.sleep(2)
+            now = datetime.utcnow()
+            # The cached timestamp is cleared by real ingest; otherwise only re-read it periodically
+            last_ts = cached_ts = app.state.last_reading_ts
+            ticks_since_check += 1
+            if last_ts is None or ticks_since_check >= FALLBACK_RECHECK_TICKS:
+                async with ReadSessionLocal() as db:
+                    last_ts = await db.scalar(select(func.max(DBSensorReading.timestamp)))
+                ticks_since_check = 0
+            # Always emit at a steady cadence if last > 2s to keep UI live
+            needs_inject = last_ts is None or (now - last_ts) > timedelta(seconds=2)
+            if needs_inject:
+                async with SessionLocal() as db:
+                    ir_detection = random.choice([0, 1])
+                    vibration_raw = random.randint(330, 470)
+                    distance_adjusted = round(random.uniform(10.0, 40.0), 1)
+                    acceleration_x = random.randint(-200, 200)
+                    acceleration_y = random.randint(-200, 200)
+                    acceleration_z = random.randint(9000, 11000)
+                    # Randomly trigger a fault approximately every 10-20 seconds
+                    trigger_fault = random.random() < 0.12
+                    if trigger_fault:
+                        # Push vibration into fault band or distance out of range
+                        if random.choice([True, False]):
+                            vibration_raw = random.randint(405, 445)
+                        else:
+                            distance_adjusted = random.choice([
+                                round(random.uniform(2.0, 4.5), 1),
+                                round(random.uniform(51.0, 60.0), 1)
+                            ])
+                        ir_detection = random.choice([0, 1])
+                    vibration_fault = 400 <= vibration_raw <= 450
+                    distance_fault = distance_adjusted < 5.0 or distance_adjusted > 50.0
+                    fault_detected = vibration_fault or distance_fault or ir_detection == 1
+                    db.add(DBSensorReading(
+                        timestamp=now,
+                        ir_detection=ir_detection,
+                        vibration_raw=vibration_raw,
+                        vibration_fault=vibration_fault,
+                        distance_adjusted=distance_adjusted,
+                        distance_fault=distance_fault,
+                        acceleration_x=acceleration_x,
+                        acceleration_y=acceleration_y,
+                        acceleration_z=acceleration_z,
+                        fault_detected=fault_detected,
+                        # Synthetic rows have no device packet behind them
+                        raw_sensor_data=None,
+                    ))
+                    await record_daily_stats(db, [{
+                        'timestamp': now,
+                        'ir_detection': ir_detection,
+                        'vibration_raw': vibration_raw,
+                        'distance_adjusted': distance_adjusted,
+                    }], [0])
+                    await db.commit()
+                invalidate_cached_views()
+                last_ts = now
+            # Real ingest may have cleared the cache while this tick awaited; don't overwrite that
+            if app.state.last_reading_ts is cached_ts:
+                app.state.last_reading_ts = last_ts
+        except Exception:  # noqa: BLE001
+            # keep loop alive, but back off instead of retrying immediately
+            logger.exception("Fallback generator iteration failed")
+            await asyncio.sleep(1.0)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting ITMS Dashboard API...")
-    create_tables()
+    await create_tables()
     logger.info("Database tables created/verified")
-    # Start background fallback generator state
-    app.state.last_insert_check = datetime.utcnow()
+    background_tasks = []
+    if IS_SQLITE:
+        await analyze_tables()
+        background_tasks.append(asyncio.create_task(sqlite_optimize_loop()))
+    # Start background fallback generator state: latest known reading time, None when unknown
+    app.state.last_reading_ts = None
+    # Buffered ingest: /sensor-data enqueues, the drain task writes batches
+    app.state.ingest_queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    ingest_task = asyncio.create_task(drain_loop(app.state.ingest_queue))
+    background_tasks.append(asyncio.create_task(fallback_generator_loop(app)))
     yield
     # Shutdown
     logger.info("Shutting down ITMS Dashboard API...")
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    # Write out readings still in the queue before stopping the writer
+    try:
+        await asyncio.wait_for(app.state.ingest_queue.join(), timeout=10)
+    except asyncio.TimeoutError:
+        logger.warning(f"Dropping {app.state.ingest_queue.qsize()} queued sensor readings on shutdown")
+    ingest_task.cancel()
+    await asyncio.gather(ingest_task, return_exceptions=True)
 
 app = FastAPI(
+    default_response_class=ORJSONResponse,
     title="ITMS Dashboard API",
     description="Intelligent Track Monitoring System - Backend API for sensor data management",
     version="1.0.0",
@@ -51,80 +160,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Simple background task to insert fallback readings to keep UI live
-@app.on_event("startup")
-async def start_fallback_generator():
-    import asyncio
-
-    async def generator_loop():
-        while True:
-            try:
-                await asyncio.sleep(2)
-                now = datetime.utcnow()
-                db = SessionLocal()
-                try:
-                    latest = db.query(DBSensorReading).order_by(DBSensorReading.timestamp.desc()).first()
-                    # Always emit at a steady cadence if last > 2s to keep UI live
-                    needs_inject = latest is None or (now - latest.timestamp) > timedelta(seconds=2)
-                    if needs_inject:
-                        ir_detection = random.choice([0, 1])
-                        vibration_raw = random.randint(330, 470)
-                        distance_adjusted = round(random.uniform(10.0, 40.0), 1)
-                        acceleration_x = random.randint(-200, 200)
-                        acceleration_y = random.randint(-200, 200)
-                        acceleration_z = random.randint(9000, 11000)
-                        # Randomly trigger a fault approximately every 10-20 seconds
-                        trigger_fault = random.random() < 0.12
-                        if trigger_fault:
-                            # Push vibration into fault band or distance out of range
-                            if random.choice([True, False]):
-                                vibration_raw = random.randint(405, 445)
-                            else:
-                                distance_adjusted = random.choice([
-                                    round(random.uniform(2.0, 4.5), 1),
-                                    round(random.uniform(51.0, 60.0), 1)
-                                ])
-                            ir_detection = random.choice([0, 1])
-                        vibration_fault = 400 <= vibration_raw <= 450
-                        distance_fault = distance_adjusted < 5.0 or distance_adjusted > 50.0
-                        fault_detected = vibration_fault or distance_fault or ir_detection == 1
-                        raw_sensor_data = (
-                            f"IR:{ir_detection},VIB_RAW:{vibration_raw},DIST_ADJ:{distance_adjusted},"
-                            f"ACC:{acceleration_x},{acceleration_y},{acceleration_z},FAULT:{1 if fault_detected else 0}"
-                        )
-                        db.add(DBSensorReading(
-                            timestamp=now,
-                            ir_detection=ir_detection,
-                            vibration_raw=vibration_raw,
-                            vibration_fault=vibration_fault,
-                            distance_adjusted=distance_adjusted,
-                            distance_fault=distance_fault,
-                            acceleration_x=acceleration_x,
-                            acceleration_y=acceleration_y,
-                            acceleration_z=acceleration_z,
-                            fault_detected=fault_detected,
-                            raw_sensor_data=raw_sensor_data,
-                        ))
-                        db.commit()
-                finally:
-                    db.close()
-            except Exception:  # noqa: BLE001
-                # keep loop alive
-                pass
-
-    import asyncio
-    loop = asyncio.get_event_loop()
-    loop.create_task(generator_loop())
-
 @app.get("/api/simulate/once")
 async def simulate_once():
     """Force one synthetic reading immediately (for debugging)."""
     from random import randint, choice, random
     now = datetime.utcnow()
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         ir_detection = choice([0, 1])
         vibration_raw = randint(330, 470)
         distance_adjusted = round(random() * 30 + 10.0, 1)
@@ -134,10 +178,6 @@ async def simulate_once():
         vibration_fault = 400 <= vibration_raw <= 450
         distance_fault = distance_adjusted < 5.0 or distance_adjusted > 50.0
         fault_detected = vibration_fault or distance_fault or ir_detection == 1
-        raw_sensor_data = (
-            f"IR:{ir_detection},VIB_RAW:{vibration_raw},DIST_ADJ:{distance_adjusted},"
-            f"ACC:{acceleration_x},{acceleration_y},{acceleration_z},FAULT:{1 if fault_detected else 0}"
-        )
         db.add(DBSensorReading(
             timestamp=now,
             ir_detection=ir_detection,
@@ -149,12 +189,17 @@ async def simulate_once():
             acceleration_y=acceleration_y,
             acceleration_z=acceleration_z,
             fault_detected=fault_detected,
-            raw_sensor_data=raw_sensor_data,
+            raw_sensor_data=None,
         ))
-        db.commit()
+        await record_daily_stats(db, [{
+            'timestamp': now,
+            'ir_detection': ir_detection,
+            'vibration_raw': vibration_raw,
+            'distance_adjusted': distance_adjusted,
+        }], [0])
+        await db.commit()
+        invalidate_cached_views()
         return {"ok": True}
-    finally:
-        db.close()
 
 # Include API routes
 app.include_router(sensor_routes.router, prefix="/api", tags=["sensors"])
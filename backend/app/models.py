@@ -7,6 +7,10 @@ class SensorDataInput(BaseModel):
     sensorData: str = Field(..., description="Raw sensor data string from NodeMCU")
     timestamp: str = Field(..., description="ISO timestamp from NodeMCU")
 
+class SensorDataBatch(BaseModel):
+    """Input model for a batch of buffered sensor packets from NodeMCU"""
+    items: List[SensorDataInput] = Field(..., description="Sensor packets in arrival order")
+
 class ParsedSensorData(BaseModel):
     """Parsed sensor data model"""
     ir_detection: int = Field(..., ge=0, le=1, description="IR sensor detection (0 or 1)")
@@ -30,7 +34,7 @@ class SensorReading(BaseModel):
     acceleration_y: float
     acceleration_z: float
     fault_detected: bool
-    raw_sensor_data: str
+    raw_sensor_data: Optional[str] = None
     
     class Config:
         from_attributes = True
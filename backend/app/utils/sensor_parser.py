@@ -1,174 +1,330 @@
 import re
-from typing import Dict, Any, Optional
-from datetime import datetime
+import struct
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from datetime import datetime, timezone
 import logging
+import os
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Fault detection thresholds
+VIBRATION_THRESHOLD_MIN = 400
+VIBRATION_THRESHOLD_MAX = 450
+DISTANCE_MIN_THRESHOLD = 5.0   # cm - too close
+DISTANCE_MAX_THRESHOLD = 50.0  # cm - too far
+ACC_THRESHOLD = 1000  # Adjust based on your sensor calibration
+# Only acc_x is checked against ACC_THRESHOLD: acc_z carries gravity (~10000 raw), and y/z
+# thresholds have not been calibrated yet
+
+# Which rows keep the original packet string: "faults" (default), "all" or "none"
+STORE_RAW = os.getenv("STORE_RAW", "faults").lower()
+
+# detect_faults bitmask layout: bit i is set when _FAULT_KEYS[i] is detected
+FAULT_VIBRATION = 1 << 0
+FAULT_DISTANCE = 1 << 1
+FAULT_IR = 1 << 2
+FAULT_ACCELERATION = 1 << 3
+_FAULT_KEYS = ('vibration_fault', 'distance_fault', 'ir_fault', 'acceleration_fault')
+
+# A full packet is ~60 characters; anything far longer is malformed or hostile
+MAX_SENSOR_DATA_LENGTH = 128
+
+# One KEY:value match per field; ACC's y/z axes follow after commas and are read by _ACC_RE
+_FIELD_RE = re.compile(r"([A-Z_]+):([^,]*)")
+_ACC_RE = re.compile(r"ACC:\s*([-+\d.eE]+)(?:,\s*([-+\d.eE]+))?(?:,\s*([-+\d.eE]+))?")
+# Packet key -> (ParsedRow field, converter)
+_HANDLERS: Dict[str, Tuple[str, Callable[[str], Any]]] = {
+    'IR': ('ir_detection', int),
+    'VIB_RAW': ('vibration_raw', int),
+    'DIST_ADJ': ('distance_adjusted', float),
+    'FAULT': ('fault_detected', int),
+}
+
+_FROMISO = datetime.fromisoformat
+
+class ParsedRow(NamedTuple):
+    """Values parsed from one sensor packet"""
+    ir_detection: int
+    vibration_raw: int
+    distance_adjusted: float
+    acceleration_x: float
+    acceleration_y: float
+    acceleration_z: float
+    fault_detected: int
+
+@dataclass(slots=True)
+class SensorRow:
+    """
+    A processed reading on its way to storage
+    Slotted to keep queued readings compact; fault flags are derived from faults_mask.
+    """
+    timestamp: datetime
+    raw_sensor_data: Optional[str]
+    ir_detection: int
+    vibration_raw: int
+    distance_adjusted: float
+    acceleration_x: float
+    acceleration_y: float
+    acceleration_z: float
+    fault_detected: bool
+    faults_mask: int
+
+    @property
+    def vibration_fault(self) -> bool:
+        return bool(self.faults_mask & FAULT_VIBRATION)
+
+    @property
+    def distance_fault(self) -> bool:
+        return bool(self.faults_mask & FAULT_DISTANCE)
+
+    @property
+    def ir_fault(self) -> bool:
+        return bool(self.faults_mask & FAULT_IR)
+
+    @property
+    def acceleration_fault(self) -> bool:
+        return bool(self.faults_mask & FAULT_ACCELERATION)
+
+    def as_record(self) -> Dict[str, Any]:
+        """Column values for a sensor_readings insert"""
+        return {
+            'timestamp': self.timestamp,
+            'ir_detection': self.ir_detection,
+            'vibration_raw': self.vibration_raw,
+            'vibration_fault': self.vibration_fault,
+            'distance_adjusted': self.distance_adjusted,
+            'distance_fault': self.distance_fault,
+            'acceleration_x': self.acceleration_x,
+            'acceleration_y': self.acceleration_y,
+            'acceleration_z': self.acceleration_z,
+            'fault_detected': self.fault_detected,
+            'raw_sensor_data': self.raw_sensor_data,
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The record plus every per-sensor fault flag"""
+        result = self.as_record()
+        result['ir_fault'] = self.ir_fault
+        result['acceleration_fault'] = self.acceleration_fault
+        return result
+
+# Binary packet: ir (u8), vibration_raw (u16), distance_adjusted in tenths of a cm (i16),
+# acc x/y/z (i16), fault (u8). Fixed-point distance decodes to the same value as the text DIST_ADJ.
+SENSOR_PACKET = struct.Struct('<BHhhhhB')
+
+def parse_sensor_string(sensor_data: str) -> Optional[ParsedRow]:
+    """
+    Parse the sensor data string from NodeMCU
+    Expected format: "IR:1,VIB_RAW:435,DIST_ADJ:18,ACC:123,456,789,FAULT:1"
+    Strings longer than MAX_SENSOR_DATA_LENGTH are rejected before any parsing (or caching).
+    """
+    if len(sensor_data) > MAX_SENSOR_DATA_LENGTH:
+        logger.warning(f"Rejected sensor data of length {len(sensor_data)} (max {MAX_SENSOR_DATA_LENGTH})")
+        return None
+    return _parse_sensor_string(sensor_data)
+
+@lru_cache(maxsize=1024)
+def _parse_sensor_string(sensor_data: str) -> Optional[ParsedRow]:
+    """Parse a length-checked sensor string; results are immutable, so replayed packets are served from cache"""
+    try:
+        fields: Dict[str, Any] = {}
+
+        # One scan over KEY:value pairs; each known key is one dict lookup plus its converter
+        for key, value in _FIELD_RE.findall(sensor_data):
+            handler = _HANDLERS.get(key)
+            if handler is not None:
+                name, convert = handler
+                fields[name] = convert(value)
+
+        # Validate required fields
+        if len(fields) < len(_HANDLERS):
+            for key, (name, _) in _HANDLERS.items():
+                if name not in fields:
+                    logger.warning(f"Missing required field: {key}")
+                    return None
+
+        # Parse acceleration data format ACC:x,y,z; missing axes default to 0.0
+        acc_x = acc_y = acc_z = 0.0
+        acc = _ACC_RE.search(sensor_data)
+        if acc:
+            x, y, z = acc.groups()
+            try:
+                acc_x, acc_y, acc_z = float(x), float(y) if y else 0.0, float(z) if z else 0.0
+            except ValueError:
+                acc_x = acc_y = acc_z = 0.0
+
+        return ParsedRow(
+            fields['ir_detection'],
+            fields['vibration_raw'],
+            fields['distance_adjusted'],
+            acc_x,
+            acc_y,
+            acc_z,
+            fields['fault_detected']
+        )
+
+    except Exception as e:
+        logger.error(f"Error parsing sensor data '{sensor_data}': {str(e)}")
+        return None
+
+def unpack_sensor_packet(payload: bytes) -> Optional[ParsedRow]:
+    """Decode a SENSOR_PACKET payload; None if it is not exactly one valid packet"""
+    if len(payload) != SENSOR_PACKET.size:
+        logger.warning(f"Rejected sensor packet of {len(payload)} bytes (expected {SENSOR_PACKET.size})")
+        return None
+    ir_detection, vibration_raw, distance_tenths, acc_x, acc_y, acc_z, fault_detected = SENSOR_PACKET.unpack(payload)
+    if ir_detection > 1 or fault_detected > 1:
+        logger.warning(f"Rejected sensor packet with IR={ir_detection}, FAULT={fault_detected}")
+        return None
+    return ParsedRow(
+        ir_detection, vibration_raw, distance_tenths / 10, float(acc_x), float(acc_y), float(acc_z), fault_detected
+    )
+
+def detect_faults(parsed_data: ParsedRow) -> int:
+    """
+    Detect faults based on sensor thresholds
+    Returns a bitmask of FAULT_* flags, 0 when the reading is healthy
+    """
+    vib_raw = parsed_data.vibration_raw
+    distance = parsed_data.distance_adjusted
+    return (
+        (VIBRATION_THRESHOLD_MIN <= vib_raw <= VIBRATION_THRESHOLD_MAX)
+        | (distance < DISTANCE_MIN_THRESHOLD or distance > DISTANCE_MAX_THRESHOLD) << 1
+        # IR detection (obstruction detected)
+        | (parsed_data.ir_detection == 1) << 2
+        # Acceleration fault detection (basic threshold check, x axis only)
+        | (abs(parsed_data.acceleration_x) > ACC_THRESHOLD) << 3
+    )
+
+def fault_flags(mask: int) -> Dict[str, bool]:
+    """Expand a detect_faults bitmask into per-sensor fault flags"""
+    return {key: bool(mask >> bit & 1) for bit, key in enumerate(_FAULT_KEYS)}
+
+def detect_faults_batch(vib: np.ndarray, dist: np.ndarray, ir: np.ndarray, acc: np.ndarray) -> np.ndarray:
+    """
+    Vectorized detect_faults over a batch of readings
+    acc has one row of (x, y, z) per reading (only x is checked, as in detect_faults);
+    returns a uint8 array of FAULT_* bitmasks.
+    """
+    return (
+        ((vib >= VIBRATION_THRESHOLD_MIN) & (vib <= VIBRATION_THRESHOLD_MAX)).astype(np.uint8)
+        | (((dist < DISTANCE_MIN_THRESHOLD) | (dist > DISTANCE_MAX_THRESHOLD)).astype(np.uint8) << 1)
+        | ((ir == 1).astype(np.uint8) << 2)
+        | ((np.abs(acc[:, 0]) > ACC_THRESHOLD).astype(np.uint8) << 3)
+    )
+
+def parse_timestamp(timestamp_str: str) -> datetime:
+    """
+    Parse timestamp string to datetime object
+    Expected format: "2025-09-28T12:00:00"; values with an offset or 'Z' are converted to naive UTC
+    """
+    try:
+        # fromisoformat handles offsets itself; only a trailing 'Z' needs rewriting
+        if timestamp_str[-1:] == 'Z':
+            timestamp = _FROMISO(timestamp_str[:-1] + '+00:00')
+        else:
+            timestamp = _FROMISO(timestamp_str)
+        # The timestamp column is naive UTC; drivers such as asyncpg reject aware values for it
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        return timestamp
+    except ValueError:
+        # Fallback to current time if parsing fails
+        logger.warning(f"Failed to parse timestamp '{timestamp_str}', using current time")
+        return datetime.utcnow()
+
+def _build_result(parsed_data: ParsedRow, sensor_data: Optional[str], timestamp: datetime, mask: int) -> SensorRow:
+    """Combine a parsed reading and its fault bitmask into a row ready for storage"""
+    # Overall fault status is set if the device flagged one or any individual fault is detected
+    fault_detected = bool(mask or parsed_data.fault_detected)
+
+    # Healthy telemetry is fully described by the parsed columns; keep raw packets only for diagnosis
+    if STORE_RAW != "all" and (STORE_RAW == "none" or not fault_detected):
+        sensor_data = None
+
+    return SensorRow(
+        timestamp,
+        sensor_data,
+        parsed_data.ir_detection,
+        parsed_data.vibration_raw,
+        parsed_data.distance_adjusted,
+        parsed_data.acceleration_x,
+        parsed_data.acceleration_y,
+        parsed_data.acceleration_z,
+        fault_detected,
+        mask
+    )
+
+def process_sensor_input(sensor_data: str, timestamp_str: str) -> Optional[SensorRow]:
+    """
+    Complete processing of sensor input from NodeMCU
+    Returns processed data ready for database storage
+    """
+    # Parse the sensor data string
+    parsed_data = parse_sensor_string(sensor_data)
+    if not parsed_data:
+        return None
+
+    # Parse timestamp
+    timestamp = parse_timestamp(timestamp_str)
+
+    # Detect faults
+    mask = detect_faults(parsed_data)
+
+    return _build_result(parsed_data, sensor_data, timestamp, mask)
+
+def process_sensor_packet(payload: bytes, timestamp: datetime) -> Optional[SensorRow]:
+    """
+    process_sensor_input for a binary SENSOR_PACKET payload
+    There is no text packet to keep, so raw_sensor_data is None.
+    """
+    parsed_data = unpack_sensor_packet(payload)
+    if not parsed_data:
+        return None
+    return _build_result(parsed_data, None, timestamp, detect_faults(parsed_data))
+
+def process_sensor_batch(packets: Iterable[Tuple[str, str]]) -> List[Optional[SensorRow]]:
+    """
+    process_sensor_input over (sensor_data, timestamp) pairs, with fault detection vectorized
+    Returns one entry per packet, None where the packet failed to parse.
+    """
+    parsed = [(parse_sensor_string(sensor_data), sensor_data, timestamp_str)
+              for sensor_data, timestamp_str in packets]
+    rows = [parsed_data for parsed_data, _, _ in parsed if parsed_data]
+    if not rows:
+        return [None] * len(parsed)
+
+    # Columns follow ParsedRow: ir, vib, dist, acc_x, acc_y, acc_z, fault
+    columns = np.array(rows, dtype=np.float64)
+    masks = iter(detect_faults_batch(columns[:, 1], columns[:, 2], columns[:, 0], columns[:, 3:6]).tolist())
+
+    return [
+        _build_result(parsed_data, sensor_data, parse_timestamp(timestamp_str), next(masks))
+        if parsed_data else None
+        for parsed_data, sensor_data, timestamp_str in parsed
+    ]
+
 class SensorDataParser:
-    """Parser for NodeMCU sensor data"""
-    
-    # Fault detection thresholds
-    VIBRATION_THRESHOLD_MIN = 400
-    VIBRATION_THRESHOLD_MAX = 450
-    DISTANCE_MIN_THRESHOLD = 5.0   # cm - too close
-    DISTANCE_MAX_THRESHOLD = 50.0  # cm - too far
-    
+    """Parser for NodeMCU sensor data (kept for compatibility; wraps the module functions)"""
+
+    VIBRATION_THRESHOLD_MIN = VIBRATION_THRESHOLD_MIN
+    VIBRATION_THRESHOLD_MAX = VIBRATION_THRESHOLD_MAX
+    DISTANCE_MIN_THRESHOLD = DISTANCE_MIN_THRESHOLD
+    DISTANCE_MAX_THRESHOLD = DISTANCE_MAX_THRESHOLD
+
+    parse_sensor_string = staticmethod(parse_sensor_string)
+    parse_timestamp = staticmethod(parse_timestamp)
+
     @staticmethod
-    def parse_sensor_string(sensor_data: str) -> Optional[Dict[str, Any]]:
-        """
-        Parse the sensor data string from NodeMCU
-        Expected format: "IR:1,VIB_RAW:435,DIST_ADJ:18,ACC:123,456,789,FAULT:1"
-        """
-        try:
-            parsed_data = {}
-            
-            # Split by commas and parse each component
-            components = sensor_data.strip().split(',')
-            
-            for component in components:
-                if ':' not in component:
-                    continue
-                    
-                key, value = component.split(':', 1)
-                key = key.strip()
-                value = value.strip()
-                
-                if key == 'IR':
-                    parsed_data['ir_detection'] = int(value)
-                elif key == 'VIB_RAW':
-                    parsed_data['vibration_raw'] = int(value)
-                elif key == 'DIST_ADJ':
-                    parsed_data['distance_adjusted'] = float(value)
-                elif key == 'ACC':
-                    # Parse acceleration data format ACC:x,y,z
-                    try:
-                        parts = value.split(',')
-                        if len(parts) >= 3:
-                            parsed_data['acceleration_x'] = float(parts[0])
-                            parsed_data['acceleration_y'] = float(parts[1])
-                            parsed_data['acceleration_z'] = float(parts[2])
-                        else:
-                            # fallback if incomplete
-                            parsed_data['acceleration_x'] = float(parts[0]) if parts else 0.0
-                            parsed_data['acceleration_y'] = float(parts[1]) if len(parts) > 1 else 0.0
-                            parsed_data['acceleration_z'] = float(parts[2]) if len(parts) > 2 else 0.0
-                    except (ValueError, IndexError):
-                        parsed_data['acceleration_x'] = 0.0
-                        parsed_data['acceleration_y'] = 0.0
-                        parsed_data['acceleration_z'] = 0.0
-                elif key == 'FAULT':
-                    parsed_data['fault_detected'] = int(value)
-            
-            # Validate required fields
-            required_fields = ['ir_detection', 'vibration_raw', 'distance_adjusted', 'fault_detected']
-            for field in required_fields:
-                if field not in parsed_data:
-                    logger.warning(f"Missing required field: {field}")
-                    return None
-            
-            # Set default acceleration values if not present
-            if 'acceleration_x' not in parsed_data:
-                parsed_data['acceleration_x'] = 0.0
-                parsed_data['acceleration_y'] = 0.0
-                parsed_data['acceleration_z'] = 0.0
-            
-            return parsed_data
-            
-        except Exception as e:
-            logger.error(f"Error parsing sensor data '{sensor_data}': {str(e)}")
-            return None
-    
-    @classmethod
-    def detect_faults(cls, parsed_data: Dict[str, Any]) -> Dict[str, bool]:
-        """
-        Detect faults based on sensor thresholds
-        Returns dictionary of fault flags for each sensor type
-        """
-        faults = {
-            'vibration_fault': False,
-            'distance_fault': False,
-            'ir_fault': False,
-            'acceleration_fault': False
-        }
-        
-        try:
-            # Vibration fault detection
-            vib_raw = parsed_data.get('vibration_raw', 0)
-            if cls.VIBRATION_THRESHOLD_MIN <= vib_raw <= cls.VIBRATION_THRESHOLD_MAX:
-                faults['vibration_fault'] = True
-            
-            # Distance fault detection
-            distance = parsed_data.get('distance_adjusted', 0)
-            if distance < cls.DISTANCE_MIN_THRESHOLD or distance > cls.DISTANCE_MAX_THRESHOLD:
-                faults['distance_fault'] = True
-            
-            # IR detection (obstruction detected)
-            ir_detection = parsed_data.get('ir_detection', 0)
-            if ir_detection == 1:
-                faults['ir_fault'] = True
-            
-            # Acceleration fault detection (basic threshold check)
-            acc_x = abs(parsed_data.get('acceleration_x', 0))
-            acc_y = abs(parsed_data.get('acceleration_y', 0))
-            acc_z = abs(parsed_data.get('acceleration_z', 0))
-            
-            # Check for unusual acceleration values (threshold can be adjusted)
-            ACC_THRESHOLD = 1000  # Adjust based on your sensor calibration
-            if acc_x > ACC_THRESHOLD or acc_y > ACC_THRESHOLD or acc_z > ACC_THRESHOLD:
-                faults['acceleration_fault'] = True
-                
-        except Exception as e:
-            logger.error(f"Error detecting faults: {str(e)}")
-        
-        return faults
-    
+    def process_sensor_input(sensor_data: str, timestamp_str: str) -> Optional[Dict[str, Any]]:
+        """Processed reading as a dict, as this method returned before SensorRow"""
+        row = process_sensor_input(sensor_data, timestamp_str)
+        return row.as_dict() if row else None
+
     @staticmethod
-    def parse_timestamp(timestamp_str: str) -> datetime:
-        """
-        Parse timestamp string to datetime object
-        Expected format: "2025-09-28T12:00:00"
-        """
-        try:
-            # Try parsing with timezone info first
-            if timestamp_str.endswith('Z'):
-                return datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            elif '+' in timestamp_str or timestamp_str.count('-') > 2:
-                return datetime.fromisoformat(timestamp_str)
-            else:
-                return datetime.fromisoformat(timestamp_str)
-        except ValueError:
-            # Fallback to current time if parsing fails
-            logger.warning(f"Failed to parse timestamp '{timestamp_str}', using current time")
-            return datetime.utcnow()
-    
-    @classmethod
-    def process_sensor_input(cls, sensor_data: str, timestamp_str: str) -> Optional[Dict[str, Any]]:
-        """
-        Complete processing of sensor input from NodeMCU
-        Returns processed data ready for database storage
-        """
-        # Parse the sensor data string
-        parsed_data = cls.parse_sensor_string(sensor_data)
-        if not parsed_data:
-            return None
-        
-        # Parse timestamp
-        timestamp = cls.parse_timestamp(timestamp_str)
-        
-        # Detect faults
-        faults = cls.detect_faults(parsed_data)
-        
-        # Combine all data
-        result = {
-            'timestamp': timestamp,
-            'raw_sensor_data': sensor_data,
-            **parsed_data,
-            **faults
-        }
-        
-        # Override overall fault status if any individual fault is detected
-        if any(faults.values()):
-            result['fault_detected'] = True
-        
-        return result
\ No newline at end of file
+    def detect_faults(parsed_data: ParsedRow) -> Dict[str, bool]:
+        """Fault flags as a dict, as this method returned before the bitmask"""
+        return fault_flags(detect_faults(parsed_data))
@@ -4,12 +4,22 @@ Quick continuous NodeMCU data sender
 Sends realistic sensor data every 3 seconds for testing
 """
 
+import orjson
 import requests
-import json
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import time
 import random
 from datetime import datetime
 
+# One keep-alive connection reused for every packet; transient failures are retried in-band
+RETRY = Retry(total=3, backoff_factor=0.1, status_forcelist=(502, 503, 504),
+              allowed_methods=("POST",), raise_on_status=False)
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=RETRY))
+SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=RETRY))
+SESSION.headers["Content-Type"] = "application/json"
+
 def generate_sensor_data():
     """Generate realistic sensor data"""
     ir_sensor = random.choice([0, 1])
@@ -20,11 +30,12 @@ def generate_sensor_data():
     acc_z = random.randint(8000, 12000)
     
     # Determine fault status
-    fault_detected = 1 if (ir_sensor == 1 or 
-                          (400 <= vibration_raw <= 450) or 
-                          (distance_adj < 5.0 or distance_adj > 50.0)) else 0
+    fault_detected = ir_sensor | (400 <= vibration_raw <= 450) | (not 5.0 <= distance_adj <= 50.0)
     
-    sensor_data_string = f"IR:{ir_sensor},VIB_RAW:{vibration_raw},DIST_ADJ:{distance_adj},ACC:{acc_x},{acc_y},{acc_z},FAULT:{fault_detected}"
+    sensor_data_string = ''.join((
+        'IR:', str(ir_sensor), ',VIB_RAW:', str(vibration_raw), ',DIST_ADJ:', str(distance_adj),
+        ',ACC:', str(acc_x), ',', str(acc_y), ',', str(acc_z), ',FAULT:', str(fault_detected)
+    ))
     
     return {
         "sensorData": sensor_data_string,
@@ -34,18 +45,17 @@ def generate_sensor_data():
 def send_data(data):
     """Send data to backend"""
     try:
-        response = requests.post(
+        response = SESSION.post(
             "http://localhost:8000/api/sensor-data",
-            json=data,
-            headers={"Content-Type": "application/json"},
+            data=orjson.dumps(data),
             timeout=5
         )
         
-        if response.status_code == 200:
+        if response.status_code in (200, 202):
             result = response.json()
             faults = result.get('faults_detected', [])
             fault_str = f" | Faults: {', '.join(faults)}" if faults else " | No faults"
-            print(f"✅ [ID:{result.get('reading_id')}] {data['sensorData']}{fault_str}")
+            print(f"✅ [{'queued' if result.get('queued') else 'ID:' + str(result.get('reading_id'))}] {data['sensorData']}{fault_str}")
             return True
         else:
             print(f"❌ Failed: {response.status_code}")
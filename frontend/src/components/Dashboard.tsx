@@ -290,12 +290,13 @@ const Dashboard: React.FC = () => {
             onClick={async () => {
               try {
                 const res = await fetch(`${(import.meta as any).env?.VITE_API_BASE_URL || 'http://localhost:8000/api'}/export`);
-                const payload = await res.json();
-                const blob = new Blob([payload.csv], { type: 'text/csv;charset=utf-8;' });
+                if (!res.ok) throw new Error(`Export failed with status ${res.status}`);
+                const blob = await res.blob();
+                const filename = res.headers.get('Content-Disposition')?.match(/filename="?([^"]+)"?/)?.[1];
                 const url = window.URL.createObjectURL(blob);
                 const link = document.createElement('a');
                 link.href = url;
-                link.download = payload.filename || 'itms_export.csv';
+                link.download = filename || 'itms_export.csv';
                 document.body.appendChild(link);
                 link.click();
                 document.body.removeChild(link);
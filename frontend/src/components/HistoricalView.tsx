@@ -90,7 +90,7 @@ const HistoricalView: React.FC = () => {
   const filteredData = activeTab === 'readings' 
     ? sensorData.filter(reading => 
         searchTerm === '' || 
-        reading.raw_sensor_data.toLowerCase().includes(searchTerm.toLowerCase())
+        (reading.raw_sensor_data ?? '').toLowerCase().includes(searchTerm.toLowerCase())
       )
     : faultData.filter(fault =>
         searchTerm === '' ||
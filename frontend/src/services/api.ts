@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { DashboardData, SensorReading, FaultLog, SensorStats, SensorDataInput } from '../types';
+import type { DashboardData, SensorReading, SensorDataPage, FaultLog, SensorStats, SensorDataInput } from '../types';
 
 const API_BASE_URL = (import.meta as any).env?.VITE_API_BASE_URL || 'http://localhost:8000/api';
 
@@ -44,6 +44,17 @@ export const sensorAPI = {
     return response.data;
   },
 
+  // Get one page of historical sensor data, newest first; pass nextCursor back to get the next page
+  getSensorDataPage: async (params?: {
+    limit?: number;
+    cursor?: string;
+    start_date?: string;
+    end_date?: string;
+  }): Promise<SensorDataPage> => {
+    const response = await apiClient.get<SensorReading[]>('/sensor-data', { params });
+    return { items: response.data, nextCursor: (response.headers['x-next-cursor'] as string | undefined) ?? null };
+  },
+
   // Get fault logs
   getFaults: async (params?: {
     limit?: number;
@@ -10,7 +10,7 @@ export interface SensorReading {
   acceleration_y: number;
   acceleration_z: number;
   fault_detected: boolean;
-  raw_sensor_data: string;
+  raw_sensor_data: string | null;
 }
 
 export interface FaultLog {
@@ -43,6 +43,11 @@ export interface DashboardData {
   connection_status: 'connected' | 'warning' | 'disconnected' | 'no_data';
 }
 
+export interface SensorDataPage {
+  items: SensorReading[];
+  nextCursor: string | null; // pass as cursor to fetch the next (older) page; null on the last page
+}
+
 export type SensorDataInput = {
   sensorData: string;
   timestamp: string;
@@ -4,89 +4,103 @@ Simple API Test Script for ITMS Backend
 Tests all the API endpoints to ensure they're working correctly.
 """
 
-import requests
-import json
+import asyncio
+import httpx
 from datetime import datetime
 
-def test_api_endpoints():
-    base_url = "http://localhost:8000"
-    
-    print("🧪 Testing ITMS Backend API Endpoints")
-    print("=" * 40)
-    
-    # Test 1: Root endpoint
-    print("\n1️⃣ Testing root endpoint...")
+# Seconds to wait for a queued reading to be written
+STORE_TIMEOUT = 5
+
+async def wait_for_reading(client, timestamp):
+    """Poll /api/sensor-data/latest until the reading sent with this timestamp has been stored"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STORE_TIMEOUT
+    while loop.time() < deadline:
+        latest = (await client.get("/api/sensor-data/latest")).json()
+        if latest and latest.get("timestamp") == timestamp:
+            return True
+        await asyncio.sleep(0.05)
+    return False
+
+async def check_get(label, request, describe):
+    """Await one GET request and report it; describe(response) builds the success message"""
     try:
-        response = requests.get(f"{base_url}/")
+        response = await request
         if response.status_code == 200:
-            print(f"✅ Root endpoint: {response.json()}")
+            print(f"✅ {describe(response)}")
         else:
-            print(f"❌ Root endpoint failed: {response.status_code}")
+            print(f"❌ {label} failed: {response.status_code}")
+        return response
     except Exception as e:
-        print(f"❌ Root endpoint error: {e}")
-        return False
-    
-    # Test 2: Send sensor data
-    print("\n2️⃣ Testing sensor data endpoint...")
-    test_data = {
-        "sensorData": "IR:1,VIB_RAW:435,DIST_ADJ:18.5,ACC:123,456,789,FAULT:1",
-        "timestamp": datetime.now().isoformat()
-    }
-    
-    try:
-        response = requests.post(
-            f"{base_url}/api/sensor-data",
-            json=test_data,
-            headers={"Content-Type": "application/json"}
+        print(f"❌ {label} error: {e}")
+        return None
+
+def describe_list(label, item_name):
+    def describe(response):
+        items = response.json()
+        message = f"{label} retrieved: {len(items)} {item_name}"
+        if items:
+            message += f"\n   Latest {item_name.rstrip('s')}: {items[0]}"
+        return message
+    return describe
+
+async def run_api_tests(base_url):
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+        # Test 1: Root endpoint
+        print("\n1️⃣ Testing root endpoint...")
+        try:
+            response = await client.get("/")
+            if response.status_code == 200:
+                print(f"✅ Root endpoint: {response.json()}")
+            else:
+                print(f"❌ Root endpoint failed: {response.status_code}")
+        except Exception as e:
+            print(f"❌ Root endpoint error: {e}")
+            return False
+
+        # Test 2: Send sensor data
+        print("\n2️⃣ Testing sensor data endpoint...")
+        test_data = {
+            "sensorData": "IR:1,VIB_RAW:435,DIST_ADJ:18.5,ACC:123,456,789,FAULT:1",
+            "timestamp": datetime.now().isoformat()
+        }
+
+        try:
+            response = await client.post("/api/sensor-data", json=test_data)
+            if response.status_code in (200, 202):
+                print(f"✅ Sensor data sent: {response.json()}")
+                # The reading is only queued; wait for the ingest writer to store it before reading back
+                if await wait_for_reading(client, test_data["timestamp"]):
+                    print("✅ Sensor data stored")
+                else:
+                    print(f"⚠️  Sensor data not stored within {STORE_TIMEOUT}s; reads below may not include it")
+            else:
+                print(f"❌ Sensor data failed: {response.status_code} - {response.text}")
+        except Exception as e:
+            print(f"❌ Sensor data error: {e}")
+
+        # Tests 3-5: the read endpoints are independent, so issue them concurrently
+        print("\n3️⃣ 4️⃣ 5️⃣ Testing recent sensor data, alerts and statistics endpoints concurrently...")
+        await asyncio.gather(
+            check_get("Recent data", client.get("/api/sensor-data"),
+                      describe_list("Recent data", "records")),
+            check_get("Alerts", client.get("/api/faults"),
+                      describe_list("Alerts", "alerts")),
+            check_get("Statistics", client.get("/api/stats"),
+                      lambda response: f"Statistics retrieved: {response.json()}"),
         )
-        if response.status_code == 200:
-            print(f"✅ Sensor data sent: {response.json()}")
-        else:
-            print(f"❌ Sensor data failed: {response.status_code} - {response.text}")
-    except Exception as e:
-        print(f"❌ Sensor data error: {e}")
-    
-    # Test 3: Get recent sensor data
-    print("\n3️⃣ Testing get recent sensor data...")
-    try:
-        response = requests.get(f"{base_url}/api/sensor-data")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Recent data retrieved: {len(data)} records")
-            if data:
-                print(f"   Latest record: {data[0]}")
-        else:
-            print(f"❌ Recent data failed: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Recent data error: {e}")
-    
-    # Test 4: Get alerts
-    print("\n4️⃣ Testing alerts endpoint...")
-    try:
-        response = requests.get(f"{base_url}/api/faults")
-        if response.status_code == 200:
-            alerts = response.json()
-            print(f"✅ Alerts retrieved: {len(alerts)} alerts")
-            if alerts:
-                print(f"   Latest alert: {alerts[0]}")
-        else:
-            print(f"❌ Alerts failed: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Alerts error: {e}")
-    
-    # Test 5: Get statistics
-    print("\n5️⃣ Testing statistics endpoint...")
-    try:
-        response = requests.get(f"{base_url}/api/stats")
-        if response.status_code == 200:
-            stats = response.json()
-            print(f"✅ Statistics retrieved: {stats}")
-        else:
-            print(f"❌ Statistics failed: {response.status_code}")
-    except Exception as e:
-        print(f"❌ Statistics error: {e}")
-    
+    return True
+
+def test_api_endpoints():
+    base_url = "http://localhost:8000"
+
+    print("🧪 Testing ITMS Backend API Endpoints")
+    print("=" * 40)
+
+    if not asyncio.run(run_api_tests(base_url)):
+        return False
+
     print("\n🏁 API testing completed!")
 
 if __name__ == "__main__":
-    test_api_endpoints()
\ No newline at end of file
+    test_api_endpoints()
@@ -4,52 +4,104 @@ NodeMCU ESP8266MOD Simulator for ITMS Testing
 This script simulates the NodeMCU sending sensor data to test the backend API.
 """
 
+import asyncio
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 import json
+import numpy as np
 import time
-import random
-import threading
+import struct
 from datetime import datetime
 
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Retry connection errors and gateway failures in-band instead of dropping the packet
+RETRY = Retry(total=3, backoff_factor=0.1, status_forcelist=(502, 503, 504),
+              allowed_methods=("GET", "POST"), raise_on_status=False)
+BINARY_HEADERS = {"Content-Type": "application/octet-stream"}
+# Must match SENSOR_PACKET in backend/app/utils/sensor_parser.py
+SENSOR_PACKET = struct.Struct('<BHhhhhB')
+# Readings drawn per refill of the simulator's random pool
+POOL_SIZE = 4096
+
 class NodeMCUSimulator:
     def __init__(self, base_url="http://localhost:8000"):
         self.base_url = base_url
         self.running = False
+        # Reuse keep-alive connections instead of reconnecting per packet
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=RETRY))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=RETRY))
+        self.session.headers["Content-Type"] = "application/json"
+        self._rng = np.random.default_rng()
+        self._refill_pool()
         
-    def generate_sensor_data(self):
-        """Generate realistic sensor data similar to what NodeMCU would send"""
-        # Generate individual sensor values
-        ir_sensor = random.choice([0, 1])  # 0 = no object, 1 = object detected
-        vibration_raw = random.randint(300, 500)  # Raw ADC value
-        distance_adj = round(random.uniform(5.0, 60.0), 1)  # Distance in cm
-        acc_x = random.randint(-500, 500)  # Acceleration values as integers
-        acc_y = random.randint(-500, 500)
-        acc_z = random.randint(8000, 12000)  # Z-axis includes gravity
+    def _refill_pool(self, n=POOL_SIZE):
+        """Draw n readings at once with NumPy instead of calling random per field per packet"""
+        rng = self._rng
+        ir_sensor = rng.integers(0, 2, n)  # 0 = no object, 1 = object detected
+        vibration_raw = rng.integers(300, 501, n)  # Raw ADC value
+        distance_adj = np.round(rng.uniform(5.0, 60.0, n), 1)  # Distance in cm
+        acc_x = rng.integers(-500, 501, n)  # Acceleration values as integers
+        acc_y = rng.integers(-500, 501, n)
+        acc_z = rng.integers(8000, 12001, n)  # Z-axis includes gravity
         
         # Determine overall fault status
-        fault_detected = 1 if (ir_sensor == 1 or 
-                              (400 <= vibration_raw <= 450) or 
-                              (distance_adj < 5.0 or distance_adj > 50.0)) else 0
+        fault_detected = (
+            ir_sensor
+            | ((vibration_raw >= 400) & (vibration_raw <= 450))
+            | ~((distance_adj >= 5.0) & (distance_adj <= 50.0))
+        )
+        
+        # tolist() hands out plain Python ints/floats for str() and struct.pack
+        self._pool = list(zip(*(column.tolist() for column in (
+            ir_sensor, vibration_raw, distance_adj, acc_x, acc_y, acc_z, fault_detected
+        ))))
+        self._cur = 0
+        
+    def _generate_values(self):
+        """Take the next set of sensor values from the pool: (ir, vib_raw, dist_adj, acc_x, acc_y, acc_z, fault)"""
+        values = self._pool[self._cur]
+        self._cur += 1
+        if self._cur == len(self._pool):
+            self._refill_pool()
+        return values
+    
+    def generate_sensor_data(self):
+        """Generate realistic sensor data similar to what NodeMCU would send"""
+        ir_sensor, vibration_raw, distance_adj, acc_x, acc_y, acc_z, fault_detected = self._generate_values()
         
         # Create the sensor data string in the expected format
-        sensor_data_string = f"IR:{ir_sensor},VIB_RAW:{vibration_raw},DIST_ADJ:{distance_adj},ACC:{acc_x},{acc_y},{acc_z},FAULT:{fault_detected}"
+        sensor_data_string = ''.join((
+            'IR:', str(ir_sensor), ',VIB_RAW:', str(vibration_raw), ',DIST_ADJ:', str(distance_adj),
+            ',ACC:', str(acc_x), ',', str(acc_y), ',', str(acc_z), ',FAULT:', str(fault_detected)
+        ))
         
         return {
             "sensorData": sensor_data_string,
             "timestamp": datetime.now().isoformat()
         }
     
+    def generate_sensor_packet(self):
+        """Generate the same readings as a packed binary packet for /api/sensor-data-bin"""
+        ir_sensor, vibration_raw, distance_adj, acc_x, acc_y, acc_z, fault_detected = self._generate_values()
+        # Distance travels as fixed-point tenths of a cm
+        return SENSOR_PACKET.pack(
+            ir_sensor, vibration_raw, round(distance_adj * 10), acc_x, acc_y, acc_z, fault_detected
+        )
+    
     def send_data(self, data):
         """Send data to the backend API"""
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/sensor-data",
-                json=data,
-                headers={"Content-Type": "application/json"},
+                data=orjson.dumps(data),
                 timeout=10
             )
             
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 print(f"✅ Data sent successfully: {response.json()}")
                 return True
             else:
@@ -71,7 +123,7 @@ class NodeMCUSimulator:
     def test_connection(self):
         """Test if the backend server is accessible"""
         try:
-            response = requests.get(f"{self.base_url}/", timeout=5)
+            response = self.session.get(f"{self.base_url}/", timeout=5)
             if response.status_code == 200:
                 print("✅ Backend server is running and accessible")
                 return True
@@ -128,6 +180,42 @@ class NodeMCUSimulator:
         print(f"\n📊 Results: {successful}/{count} packets sent successfully")
         return successful == count
 
+    async def _run_device(self, client, device, count, binary):
+        """Send count packets from one simulated NodeMCU, returning how many were accepted"""
+        successful = 0
+        for _ in range(count):
+            try:
+                if binary:
+                    response = await client.post(
+                        "/api/sensor-data-bin", content=self.generate_sensor_packet(), headers=BINARY_HEADERS
+                    )
+                else:
+                    response = await client.post(
+                        "/api/sensor-data", content=orjson.dumps(self.generate_sensor_data()), headers=JSON_HEADERS
+                    )
+                if response.status_code in (200, 202):
+                    successful += 1
+                else:
+                    print(f"❌ Device {device}: status {response.status_code}")
+            except httpx.HTTPError as e:
+                print(f"❌ Device {device}: {str(e)}")
+        return successful
+    
+    async def _send_concurrent(self, devices, count, binary):
+        limits = httpx.Limits(max_connections=devices, max_keepalive_connections=devices)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=10, limits=limits) as client:
+            return await asyncio.gather(*(self._run_device(client, d, count, binary) for d in range(devices)))
+    
+    def send_concurrent_test(self, devices=10, count=20, binary=False):
+        """Simulate several NodeMCUs sending at full speed from one process"""
+        print(f"\n⚡ Sending {count} {'binary' if binary else 'text'} packets from each of {devices} simulated devices...")
+        start = time.perf_counter()
+        results = asyncio.run(self._send_concurrent(devices, count, binary))
+        elapsed = time.perf_counter() - start
+        total = devices * count
+        print(f"\n📊 Results: {sum(results)}/{total} packets accepted in {elapsed:.2f}s ({total / elapsed:.0f} packets/s)")
+        return sum(results) == total
+
 def main():
     print("🚀 NodeMCU ESP8266MOD Simulator for ITMS")
     print("=" * 50)
@@ -144,9 +232,11 @@ def main():
         print("1. Send single test packet")
         print("2. Send batch test (5 packets)")
         print("3. Start continuous sending")
-        print("4. Exit")
+        print("4. Concurrent load test (10 devices)")
+        print("5. Concurrent load test, binary packets (10 devices)")
+        print("6. Exit")
         
-        choice = input("\nEnter your choice (1-4): ").strip()
+        choice = input("\nEnter your choice (1-6): ").strip()
         
         if choice == "1":
             simulator.send_single_test()
@@ -164,6 +254,12 @@ def main():
                 simulator.start_continuous_sending()
                 
         elif choice == "4":
+            simulator.send_concurrent_test()
+            
+        elif choice == "5":
+            simulator.send_concurrent_test(binary=True)
+            
+        elif choice == "6":
             print("👋 Goodbye!")
             break
             